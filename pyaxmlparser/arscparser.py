@@ -36,6 +36,8 @@ class ARSCParser(object):
     def __init__(self, raw_buff):
         self.analyzed = False
         self._resolved_strings = None
+        # string resources by name for each (package_name, locale), see get_string
+        self._string_index = {}
         self.buff = bytecode.BuffHandle(raw_buff)
 
         self.header = ARSCHeader(self.buff)
@@ -667,11 +669,18 @@ class ARSCParser(object):
         self._analyse()
 
         try:
-            for i in self.values[package_name][locale]["string"]:
-                if i[0] == name:
-                    return i
+            index = self._string_index[(package_name, locale)]
         except KeyError:
-            return None
+            try:
+                strings = self.values[package_name][locale]["string"]
+            except KeyError:
+                return None
+            # The first string with a name wins, like with a linear search
+            index = {}
+            for i in strings:
+                index.setdefault(i[0], i)
+            self._string_index[(package_name, locale)] = index
+        return index.get(name)
 
     def get_res_id_by_key(self, package_name, resource_type, key):
         try:
@@ -17,8 +17,8 @@ from __future__ import division
 from __future__ import print_function
 
 from builtins import str
-from struct import unpack
 from pyaxmlparser.utils import read, format_value, get_certificate_name_string
+from pyaxmlparser.utils import parse_lxml_dom  # noqa: F401, deprecated and kept importable from here
 
 from pyaxmlparser.arscparser import ARSCParser
 from pyaxmlparser.axmlprinter import AXMLPrinter
@@ -29,31 +29,175 @@ import pyaxmlparser.constants as const
 
 
 import io
+import mmap
+import struct
 from zlib import crc32
 import os
 import re
+import shutil
+import sys
 import zipfile
 import logging
 import hashlib
 import binascii
+from collections import OrderedDict
 
-import lxml.sax
-from xml.dom.pulldom import SAX2DOM
+from lxml import etree
 
-# Used for reading Certificates
-from asn1crypto import cms, x509, keys
+# asn1crypto, used for reading Certificates, is imported by the functions
+# that need it, as it is not required for the manifest and resources.
+
+try:
+    # Magic is optional
+    import magic
+    _MAGIC_IMPORT_ERROR = None
+except (ImportError, TypeError) as e:
+    magic = None
+    _MAGIC_IMPORT_ERROR = e
+
+# There are several implementations of magic,
+# unfortunately all called magic
+# We use this one: https://github.com/ahupp/python-magic/
+_HAS_MAGIC = magic is not None and hasattr(magic, "MagicException")
 
 
 NS_ANDROID_URI = 'http://schemas.android.com/apk/res/android'
 NS_ANDROID = '{{{}}}'.format(NS_ANDROID_URI)  # Namespace as used by etree
 
+
+class _NamespacedNames(dict):
+    """
+    Attribute names with the android namespace, by plain name.
+    Each name is only built on its first lookup.
+    """
+
+    def __missing__(self, name):
+        value = self[name] = NS_ANDROID + name
+        return value
+
+
+_NS_NAMES = _NamespacedNames()
+
+
 log = logging.getLogger("pyaxmlparser.core")
 
+# Precompiled queries on the AndroidManifest.xml, only elements without namespace
+# are matched like with findall()
+_XP_INTENT_FILTER = etree.XPath(".//intent-filter")
+# Enabled activities and activity-aliases, in document order
+_XP_ENABLED_ACTIVITIES = etree.XPath(
+    "(.//activity | .//activity-alias)[not(@android:enabled='false')]",
+    namespaces={"android": NS_ANDROID_URI})
+
+# Little endian uint32, as used all over the APK Signing Block
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+# algorithm id and length of a signature or digest
+_U32_PAIR = struct.Struct('<II')
+# End of Central Directory, after its signature
+_EOCD = struct.Struct('<HHHHII')
+# The End of Central Directory record is 22 bytes long,
+# followed by a comment of at most 65535 bytes
+_ZIP_EOCD_SEARCH_SIZE = 22 + 0xFFFF
+# size_of_block and magic right before the Central Directory
+_SIG_BLOCK_FOOTER = struct.Struct('<Q16s')
+# size and ID of an ID-value pair in the APK Signing Block
+_ID_VALUE_HEADER = struct.Struct('<QI')
+
+# File types by their first three or four bytes, see is_android_raw
+_RAW_MAGIC = {
+    b"dex": "DEX",
+    b"dey": "DEY",
+    b"\x03\x00\x08\x00": "AXML",
+    b"\x00\x00\x08\x00": "AXML",
+    b"\x02\x00\x0C\x00": "ARSC",
+}
+
+# Extensions of the v1 / JAR signature block files in META-INF/
+_SIGNATURE_BLOCK_EXTENSIONS = (".RSA", ".EC", ".DSA")
+
+# A tag name which is not a path expression, see _iter_tags_from_xml
+_PLAIN_TAG_RE = re.compile(r"[\w-]+")
+
+# A resource id as referenced by ensure_final_value, int() alone also
+# accepts a sign, whitespace, a 0x prefix and underscores
+_RES_ID_RE = re.compile(r"[0-9a-fA-F]+")
+
+
+def _zip_has_entry(raw, name):
+    """
+    Check if the central directory of a ZIP file lists an entry called name.
+
+    Only the end of the file is searched for the End of Central Directory,
+    and only the central directory itself is walked afterwards.
+
+    :param raw: the whole ZIP file
+    :param bytes name: the entry to look for
+    :returns: True or False, or None if the central directory could not be parsed
+    """
+    eocd = raw.rfind(APK._PK_END_OF_CENTRAL_DIR, max(0, len(raw) - _ZIP_EOCD_SEARCH_SIZE))
+    if eocd < 0:
+        return None
+
+    with memoryview(raw) as view:
+        try:
+            total_entries, size_central, offset_central = struct.unpack_from('<HII', view, eocd + 10)
+            offset = offset_central
+            for _ in range(total_entries):
+                if view[offset:offset + 4] != APK._PK_CENTRAL_DIR:
+                    # ZIP64 or data prepended to the ZIP
+                    return None
+                name_len, extra_len, comment_len = struct.unpack_from('<HHH', view, offset + 28)
+                if view[offset + 46:offset + 46 + name_len] == name:
+                    return True
+                offset += 46 + name_len + extra_len + comment_len
+        except struct.error:
+            return None
+    return False
+
 
-def parse_lxml_dom(tree):
-    handler = SAX2DOM()
-    lxml.sax.saxify(tree, handler)
-    return handler.document
+def _is_dex_name(name):
+    """
+    Return True if name is an official DEX file name,
+    i.e. classes.dex or classes[0-9]+.dex in the root directory of the APK
+    """
+    if not (name.startswith("classes") and name.endswith(".dex")):
+        return False
+    number = name[7:-4]
+    # str.isdecimal() accepts the same digits as \d in a regex
+    return number == "" or number.isdecimal()
+
+
+def _compile_attribute_filter(attribute_filter):
+    """
+    Turn an attribute filter into a list of
+    (namespaced name, plain name, expected value) tuples,
+    so the names are built once and not once per tag.
+    """
+    return [
+        (_NS_NAMES[attr], attr, value)
+        for attr, value in attribute_filter.items()
+    ]
+
+
+def _is_attribute_filter_matched(tag, filter_items):
+    """
+    Return True if tag matches all items of a compiled attribute filter.
+
+    Like :meth:`APK.get_value_from_tag`, the namespaced attribute is preferred
+    and the attribute without namespace is used as a fallback, with a warning.
+    """
+    for ns_attr, attr, value in filter_items:
+        _value = tag.get(ns_attr)
+        if _value is None:
+            _value = tag.get(attr)
+
+            if _value:
+                log.warning("Failed to get the attribute '{}' on tag '{}' with namespace. "
+                            "But found the same attribute without namespace!".format(attr, tag.tag))
+        if _value != value:
+            return False
+    return True
 
 
 class Error(Exception):
@@ -71,36 +215,83 @@ class BrokenAPKError(Error):
 def _dump_additional_attributes(additional_attributes):
     """ try to parse additional attributes, but ends up to hexdump if the scheme is unknown """
 
-    attributes_raw = io.BytesIO(additional_attributes)
-    attributes_hex = binascii.hexlify(additional_attributes)
+    # length, id and scheme of the stripping protection attribute
+    if len(additional_attributes) < 12:
+        return binascii.hexlify(additional_attributes)
 
-    if not len(additional_attributes):
-        return attributes_hex
-
-    len_attribute, = unpack('<I', attributes_raw.read(4))
+    len_attribute, = _U32.unpack_from(additional_attributes, 0)
     if len_attribute != 8:
-        return attributes_hex
+        return binascii.hexlify(additional_attributes)
 
-    attr_id, = unpack('<I', attributes_raw.read(4))
+    attr_id, = _U32.unpack_from(additional_attributes, 4)
     if attr_id != APK._APK_SIG_ATTR_V2_STRIPPING_PROTECTION:
-        return attributes_hex
+        return binascii.hexlify(additional_attributes)
 
-    scheme_id, = unpack('<I', attributes_raw.read(4))
+    scheme_id, = _U32.unpack_from(additional_attributes, 8)
 
     return "stripping protection set, scheme %d" % scheme_id
 
 
 def _dump_digests_or_signatures(digests_or_sigs):
 
-    infos = ""
-    for i,dos in enumerate(digests_or_sigs):
+    algo_ids = APK._APK_SIG_ALGO_IDS
+    infos = []
+    for i, dos in enumerate(digests_or_sigs):
+        infos.append("\n [%d]\n  - Signature Id : %s\n  - Digest: %s" % (
+            i, algo_ids.get(dos[0], hex(dos[0])), binascii.hexlify(dos[1])))
+
+    return "".join(infos)
 
-        infos += "\n"
-        infos += " [%d]\n" % i
-        infos += "  - Signature Id : %s\n" % APK._APK_SIG_ALGO_IDS.get(dos[0], hex(dos[0]))
-        infos += "  - Digest: %s" % binascii.hexlify(dos[1])
 
-    return infos
+def _read_length_prefixed(data, offset):
+    """
+    Read a uint32 length-prefixed value from data
+
+    :returns: the value and the offset right after it
+    """
+    length, = _U32.unpack_from(data, offset)
+    offset += 4
+    value = data[offset:offset + length]
+    return value, offset + len(value)
+
+
+def _parse_signing_block(data, offset_central):
+    """
+    Parse the APK Signing Block, which is located right before the Central Directory
+
+    :param data: the content of the APK, as bytes or mmap
+    :param offset_central: the offset of the Central Directory
+    :returns: a dict of the values by ID, or None if there is no APK Signing Block
+    """
+    # Go back and check if we have a magic
+    end_offset = offset_central
+    if end_offset < 24:
+        raise BrokenAPKError("No room for an APK Signing Block before the Central Dir")
+    size_of_block, magic = _SIG_BLOCK_FOOTER.unpack_from(data, end_offset - 24)
+    if magic != APK._APK_SIG_MAGIC:
+        return None
+
+    # go back size_of_blocks + 8 and read size_of_block again
+    start_offset = end_offset - size_of_block - 8
+    if start_offset < 0:
+        raise BrokenAPKError("APK Signing Block is bigger than the APK!")
+    size_of_block_start, = _U64.unpack_from(data, start_offset)
+    if size_of_block_start != size_of_block:
+        raise BrokenAPKError("Sizes at beginning and and does not match!")
+
+    # Read all blocks
+    blocks = {}
+    offset = start_offset + 8
+    while offset < end_offset - 24:
+        size, key = _ID_VALUE_HEADER.unpack_from(data, offset)
+        if size < 4:
+            raise BrokenAPKError("ID-value pair is shorter than its ID!")
+        offset += 12
+        # Slicing copies, so the values outlive a mmap. get_raw() of an
+        # APK opened from a path is a bytearray, its slices are converted.
+        blocks[key] = bytes(data[offset:offset + size - 4])
+        offset += size - 4
+    return blocks
 
 
 class APKV2SignedData:
@@ -114,28 +305,39 @@ class APKV2SignedData:
         self.digests = None
         self.certificates =  None
         self.additional_attributes = None
+        # parsed X.509 certificates by DER bytes, see __str__.
+        # The APK shares its own cache here, see APK._load_asn1
+        self._cert_cache = {}
 
     def __str__(self):
 
-        certs_infos = ""
+        from asn1crypto import x509
 
-        for i,cert in enumerate(self.certificates):
-            x509_cert = x509.Certificate.load(cert)
+        certs_infos = []
 
-            certs_infos += "\n"
-            certs_infos += " [%d]\n" % i
-            certs_infos += "  - Issuer: %s\n" % get_certificate_name_string(x509_cert.issuer, short=True)
-            certs_infos += "  - Subject: %s\n" % get_certificate_name_string(x509_cert.subject, short=True)
-            certs_infos += "  - Serial Number: %s\n" % hex(x509_cert.serial_number)
-            certs_infos += "  - Hash Algorithm: %s\n" % x509_cert.hash_algo
-            certs_infos += "  - Signature Algorithm: %s\n" % x509_cert.signature_algo
-            certs_infos += "  - Valid not before: %s\n" % x509_cert['tbs_certificate']['validity']['not_before'].native
-            certs_infos += "  - Valid not after: %s" % x509_cert['tbs_certificate']['validity']['not_after'].native
+        for i, cert in enumerate(self.certificates):
+            try:
+                x509_cert = self._cert_cache[cert]
+            except KeyError:
+                x509_cert = self._cert_cache[cert] = x509.Certificate.load(cert)
+            validity = x509_cert['tbs_certificate']['validity']
+
+            certs_infos.append("\n".join([
+                "",
+                " [%d]" % i,
+                "  - Issuer: %s" % get_certificate_name_string(x509_cert.issuer, short=True),
+                "  - Subject: %s" % get_certificate_name_string(x509_cert.subject, short=True),
+                "  - Serial Number: %s" % hex(x509_cert.serial_number),
+                "  - Hash Algorithm: %s" % x509_cert.hash_algo,
+                "  - Signature Algorithm: %s" % x509_cert.signature_algo,
+                "  - Valid not before: %s" % validity['not_before'].native,
+                "  - Valid not after: %s" % validity['not_after'].native,
+            ]))
 
         return "\n".join([
             'additional_attributes : {}'.format(_dump_additional_attributes(self.additional_attributes)),
             'digests : {}'.format(_dump_digests_or_signatures(self.digests)),
-            'certificates : {}'.format(certs_infos),
+            'certificates : {}'.format("".join(certs_infos)),
         ])
 
 
@@ -265,9 +467,11 @@ class APK:
 
         self.package = ""
         self.androidversion = {}
-        self.permissions = []
-        self.uses_permissions = []
-        self.declared_permissions = {}
+        # The permissions are only parsed on first access,
+        # see the permissions, uses_permissions and declared_permissions properties
+        self._permissions = None
+        self._uses_permissions = None
+        self._declared_permissions = None
         self.valid_apk = False
 
         self._is_signed_v2 = None
@@ -275,12 +479,30 @@ class APK:
         self._v2_blocks = {}
         self._v2_signing_data = None
         self._v3_signing_data = None
+        # DER coded certificates by signature file, see get_certificate_der
+        self._certificate_der = {}
+        # see _get_signature_files and _get_signature_names
+        self._signature_files = None
+        self._signature_names = None
+        # parsed certificates and public keys by DER bytes, see _load_asn1
+        self._asn1_objects = {}
 
         self._files = {}
+        self._file_names = None
         self.files_crc32 = {}
+        # resolved @string/ references, see _get_res_string_value
+        self._string_cache = {}
+        # results of the lookups on the manifest, see _cached
+        self._manifest_cache = {}
+        # elements of each xml by tag name, see _get_tag_index
+        self._tag_index = {}
+        # elements by type and name, see _get_items_by_name
+        self._items_by_name = {}
 
         if raw is True:
-            self.__raw = bytearray(filename)
+            # bytes() returns the very same object for bytes input, thus the
+            # caller's buffer is neither copied here nor by io.BytesIO below.
+            self.__raw = bytes(filename)
             self._sha256 = hashlib.sha256(self.__raw).hexdigest()
             # Set the filename to something sane
             self.filename = "raw_apk_sha256:{}".format(self._sha256)
@@ -317,11 +539,25 @@ class APK:
         """
         return repr
 
+    def _cached(self, key, func, *args):
+        """
+        Return func(*args), which is only computed on the first call for key.
+
+        The manifest does not change once parsed, thus the results of the
+        lookups on it are kept on the object. Callers have to copy the
+        returned value before handing it out.
+        """
+        try:
+            return self._manifest_cache[key]
+        except KeyError:
+            value = self._manifest_cache[key] = func(*args)
+            return value
+
     def _ns(self, name):
         """
         return the name including the Android namespace
         """
-        return NS_ANDROID + name
+        return _NS_NAMES[name]
 
     def _apk_analysis(self):
         """
@@ -330,7 +566,18 @@ class APK:
         This method is usually called by __init__ except if skip_analysis is False.
         It will then parse the AndroidManifest.xml and set all fields in the APK class which can be
         extracted from the Manifest.
+
+        The permissions are not resolved here but on first access of
+        :attr:`permissions`, :attr:`uses_permissions` or :attr:`declared_permissions`.
         """
+        self._manifest_cache = {}
+        self._tag_index = {}
+        self._items_by_name = {}
+        # Resolved again from the new manifest on next access
+        self._permissions = None
+        self._uses_permissions = None
+        self._declared_permissions = None
+
         i = "AndroidManifest.xml"
         try:
             manifest_data = self.zip.read(i)
@@ -357,38 +604,117 @@ class APK:
                 self.package = self.get_attribute_value("manifest", "package")
                 self.androidversion["Code"] = self.get_attribute_value("manifest", "versionCode")
                 self.androidversion["Name"] = self.get_attribute_value("manifest", "versionName")
-                permission = list(self.get_all_attribute_value("uses-permission", "name"))
-                self.permissions = list(set(self.permissions + permission))
-
-                for uses_permission in self.find_tags("uses-permission"):
-                    self.uses_permissions.append([
-                        self.get_value_from_tag(uses_permission, "name"),
-                        self._get_permission_maxsdk(uses_permission)
-                    ])
-
-                # getting details of the declared permissions
-                for d_perm_item in self.find_tags('permission'):
-                    d_perm_name = self._get_res_string_value(
-                        str(self.get_value_from_tag(d_perm_item, "name")))
-                    d_perm_label = self._get_res_string_value(
-                        str(self.get_value_from_tag(d_perm_item, "label")))
-                    d_perm_description = self._get_res_string_value(
-                        str(self.get_value_from_tag(d_perm_item, "description")))
-                    d_perm_permissionGroup = self._get_res_string_value(
-                        str(self.get_value_from_tag(d_perm_item, "permissionGroup")))
-                    d_perm_protectionLevel = self._get_res_string_value(
-                        str(self.get_value_from_tag(d_perm_item, "protectionLevel")))
-
-                    d_perm_details = {
-                        "label": d_perm_label,
-                        "description": d_perm_description,
-                        "permissionGroup": d_perm_permissionGroup,
-                        "protectionLevel": d_perm_protectionLevel,
-                    }
-                    self.declared_permissions[d_perm_name] = d_perm_details
 
                 self.valid_apk = True
 
+    def _resolve_permissions(self):
+        """
+        Parse the requested permissions (<uses-permission>) from the AndroidManifest.xml
+
+        Only the lists which are not resolved or set yet are filled in.
+        """
+        permissions = []
+        uses_permissions = []
+        if self.valid_apk:
+            # Drop the duplicates, but keep the order of the manifest
+            permissions = list(OrderedDict.fromkeys(self.get_all_attribute_value("uses-permission", "name")))
+
+            for uses_permission in self.iter_tags("uses-permission"):
+                uses_permissions.append([
+                    self.get_value_from_tag(uses_permission, "name"),
+                    self._get_permission_maxsdk(uses_permission)
+                ])
+
+        if self._permissions is None:
+            self._permissions = permissions
+        if self._uses_permissions is None:
+            self._uses_permissions = uses_permissions
+
+    def _resolve_declared_permissions(self):
+        """
+        Parse the declared permissions (<permission>) from the AndroidManifest.xml
+        and resolve their string resources
+        """
+        self._declared_permissions = {}
+        if not self.valid_apk:
+            return
+
+        # getting details of the declared permissions
+        for d_perm_item in self.iter_tags('permission'):
+            d_perm_name = self._get_res_string_value(
+                str(self.get_value_from_tag(d_perm_item, "name")))
+            d_perm_label = self._get_res_string_value(
+                str(self.get_value_from_tag(d_perm_item, "label")))
+            d_perm_description = self._get_res_string_value(
+                str(self.get_value_from_tag(d_perm_item, "description")))
+            d_perm_permissionGroup = self._get_res_string_value(
+                str(self.get_value_from_tag(d_perm_item, "permissionGroup")))
+            d_perm_protectionLevel = self._get_res_string_value(
+                str(self.get_value_from_tag(d_perm_item, "protectionLevel")))
+
+            d_perm_details = {
+                "label": d_perm_label,
+                "description": d_perm_description,
+                "permissionGroup": d_perm_permissionGroup,
+                "protectionLevel": d_perm_protectionLevel,
+            }
+            self._declared_permissions[d_perm_name] = d_perm_details
+
+    @property
+    def permissions(self):
+        """
+        List of the requested permission names, parsed on first access
+        """
+        if self._permissions is None:
+            self._resolve_permissions()
+        return self._permissions
+
+    @permissions.setter
+    def permissions(self, value):
+        self._permissions = value
+
+    @property
+    def uses_permissions(self):
+        """
+        List of [name, maxSdkVersion] of the requested permissions, parsed on first access
+        """
+        if self._uses_permissions is None:
+            self._resolve_permissions()
+        return self._uses_permissions
+
+    @uses_permissions.setter
+    def uses_permissions(self, value):
+        self._uses_permissions = value
+        self._manifest_cache.pop("uses_permissions_max_sdk", None)
+
+    def _get_uses_permissions_max_sdk(self):
+        """
+        Return the maxSdkVersion of the requested permissions by name.
+        If a permission is requested more than once, the first tag is used.
+
+        :rtype: a dict of str to int or None, which must not be modified
+        """
+        def build():
+            index = {}
+            for name, max_sdk in self.uses_permissions:
+                index.setdefault(name, max_sdk)
+            return index
+
+        return self._cached("uses_permissions_max_sdk", build)
+
+    @property
+    def declared_permissions(self):
+        """
+        Dictionary of the declared permissions and their details, parsed on first access
+        """
+        if self._declared_permissions is None:
+            self._resolve_declared_permissions()
+        return self._declared_permissions
+
+    @declared_permissions.setter
+    def declared_permissions(self, value):
+        self._declared_permissions = value
+
     def __getstate__(self):
         """
         Function for pickling APK Objects.
@@ -399,10 +725,18 @@ class APK:
         :return: the picklable APK Object without zip.
         """
         # Upon pickling, we need to remove the ZipFile
-        x = self.__dict__
+        x = self.__dict__.copy()
+        # The permissions need the parsed xml, which is not pickled.
+        # The properties only resolve them if not resolved or set yet.
+        x['_permissions'] = self.permissions
+        x['_uses_permissions'] = self.uses_permissions
+        x['_declared_permissions'] = self.declared_permissions
         x['axml'] = str(x['axml'])
         x['xml'] = str(x['xml'])
         del x['zip']
+        # lxml elements can not be pickled
+        x['_tag_index'] = {}
+        x['_items_by_name'] = {}
 
         return x
 
@@ -410,17 +744,23 @@ class APK:
         """
         Load a pickled APK Object and restore the state
 
-        We load the zip file back by reading __raw from the Object.
+        We load the zip file back by reading __raw from the Object,
+        or by reopening the file if the APK was loaded from a path
+        and its content was never read.
 
         :param state: pickled state
         """
         self.__dict__ = state
 
-        self.zip = zipfile.ZipFile(io.BytesIO(self.__raw), mode="r")
+        self.zip = self._open_zip()
 
     def _get_res_string_value(self, string):
         if not string.startswith('@string/'):
             return string
+        try:
+            return self._string_cache[string]
+        except KeyError:
+            pass
         string_key = string[8:]
 
         res_parser = self.get_android_resources()
@@ -432,6 +772,7 @@ class APK:
             if extracted_values:
                 string_value = extracted_values[1]
                 break
+        self._string_cache[string] = string_value
         return string_value
 
     def _get_permission_maxsdk(self, item):
@@ -478,10 +819,7 @@ class APK:
 
         app_name = self.get_attribute_value('application', 'label')
         if app_name is None:
-            activities = self.get_main_activities()
-            main_activity_name = None
-            if len(activities) > 0:
-                main_activity_name = activities.pop()
+            main_activity_name = next(self._iter_main_activities(), None)
             app_name = self.get_attribute_value(
                 'activity', 'label', name=main_activity_name
             )
@@ -555,6 +893,10 @@ class APK:
         For more information read here: https://stackoverflow.com/a/34370735/446140
         :rtype: :class:`str`
         """
+        # The resources are resolved only once for each max_dpi
+        return self._cached(("app_icon", max_dpi), self._find_app_icon, max_dpi)
+
+    def _find_app_icon(self, max_dpi):
         main_activity_name = self.get_main_activity()
 
         app_icon = self.get_attribute_value(
@@ -638,7 +980,17 @@ class APK:
 
         :rtype: a list of :class:`str`
         """
-        return self.zip.namelist()
+        return list(self._get_file_names())
+
+    def _get_file_names(self):
+        """
+        Return the file names inside the APK, the list is only built once.
+
+        :rtype: a list of :class:`str`, which must not be modified
+        """
+        if self._file_names is None:
+            self._file_names = self.zip.namelist()
+        return self._file_names
 
     def _get_file_magic_name(self, buffer):
         """
@@ -649,33 +1001,25 @@ class APK:
         default = "Unknown"
         ftype = None
 
-        try:
-            # Magic is optional
-            import magic
-        except ImportError:
-            self.__no_magic = True
-            log.warning("No Magic library was found on your system.")
-            return default
-        except TypeError as e:
+        if not _HAS_MAGIC:
+            if self.__no_magic:
+                # Already warned about it
+                return default
             self.__no_magic = True
-            log.warning("It looks like you have the magic python package installed but not the magic library itself!")
-            log.warning("Error from magic library: %s", e)
-            log.warning("Please follow the installation instructions at https://github.com/ahupp/python-magic/#installation")
-            log.warning("You can also install the 'python-magic-bin' package on Windows and MacOS")
-            return default
-
-        try:
-            # There are several implementations of magic,
-            # unfortunately all called magic
-            # We use this one: https://github.com/ahupp/python-magic/
-            getattr(magic, "MagicException")
-        except AttributeError:
-            # Looks like no magic was installed
+            if isinstance(_MAGIC_IMPORT_ERROR, ImportError):
+                log.warning("No Magic library was found on your system.")
+            elif isinstance(_MAGIC_IMPORT_ERROR, TypeError):
+                log.warning("It looks like you have the magic python package installed "
+                            "but not the magic library itself!")
+                log.warning("Error from magic library: %s", _MAGIC_IMPORT_ERROR)
+                log.warning("Please follow the installation instructions at "
+                            "https://github.com/ahupp/python-magic/#installation")
+                log.warning("You can also install the 'python-magic-bin' package on Windows and MacOS")
             return default
 
         try:
             ftype = magic.from_buffer(buffer[:1024])
-        except magic.MagicError as e:
+        except magic.MagicException as e:
             log.exception("Error getting the magic type!")
             return default
 
@@ -701,16 +1045,29 @@ class APK:
         """
         if self._files == {}:
             # Generate File Types / CRC List
-            for i in self.get_files():
-                buffer = self.zip.read(i)
-                self.files_crc32[i] = crc32(buffer)
-                # FIXME why not use the crc from the zipfile?
-                # should be validated as well.
-                # crc = self.zip.getinfo(i).CRC
-                self._files[i] = self._get_file_magic_name(buffer)
+            self.get_files_crc32()
+
+            for name in self._get_file_names():
+                # Only the header is needed for the detection,
+                # but zip files are told apart by their content, see _patch_magic
+                with self.zip.open(name) as fd:
+                    buffer = fd.read(1024)
+                    if buffer.startswith(b"PK"):
+                        buffer += fd.read()
+                self._files[name] = self._get_file_magic_name(buffer)
 
         return self._files
 
+    def _open_zip(self):
+        """
+        Open a :class:`zipfile.ZipFile` on the loaded content of the APK, or else on its file
+
+        :rtype: :class:`zipfile.ZipFile`
+        """
+        if self.__raw is not None:
+            return zipfile.ZipFile(io.BytesIO(self.__raw), mode="r")
+        return zipfile.ZipFile(self.filename, mode="r")
+
     def _patch_magic(self, buffer, orig):
         """
         Overwrite some probably wrong detections by mime libraries
@@ -726,16 +1083,33 @@ class APK:
 
         return orig
 
-    def get_files_crc32(self):
+    def get_files_crc32(self, verify=False):
         """
-        Calculates and returns a dictionary of filenames and CRC32
+        Return a dictionary of filenames and CRC32
+
+        By default, the CRC32 are read from the central directory of the APK,
+        the content of the files is not verified against them.
+        With verify, every file is inflated and its CRC32 is computed instead,
+        which differs from the stored one for a corrupted or tampered file.
 
+        :param verify: compute the CRC32 from the content of the files
         :return: dict of filename: CRC32
         """
-        if self.files_crc32 == {}:
-            for i in self.get_files():
-                buffer = self.zip.read(i)
-                self.files_crc32[i] = crc32(buffer)
+        if verify:
+            files_crc32 = {}
+            for name in self._get_file_names():
+                # Streamed in chunks, so large files are never held in memory at once
+                crc = 0
+                with self.zip.open(name) as fd:
+                    # The computed CRC32 is returned, ZipFile must not raise on a mismatch
+                    fd._expected_crc = None
+                    for chunk in iter(lambda: fd.read(1 << 20), b""):
+                        crc = crc32(chunk, crc)
+                files_crc32[name] = crc
+            self.files_crc32 = files_crc32
+        elif self.files_crc32 == {}:
+            for name in self._get_file_names():
+                self.files_crc32[name] = self.zip.getinfo(name).CRC
 
         return self.files_crc32
 
@@ -745,8 +1119,10 @@ class APK:
 
         :rtype: str, str, int
         """
-        for k in self.get_files():
-            yield k, self.get_files_types()[k], self.get_files_crc32()[k]
+        files_types = self.get_files_types()
+        files_crc32 = self.get_files_crc32()
+        for k in self._get_file_names():
+            yield k, files_types[k], files_crc32[k]
 
     def get_raw(self):
         """
@@ -792,10 +1168,11 @@ class APK:
         This method only accounts for "offical" dex files, i.e. all files
         in the root directory of the APK named classes.dex or classes[0-9]+.dex
 
-        :rtype: a list of str
+        :rtype: a generator of str
         """
-        dexre = re.compile(r"classes(\d*).dex")
-        return filter(lambda x: dexre.match(x), self.get_files())
+        for name in self._get_file_names():
+            if _is_dex_name(name):
+                yield name
 
     def get_all_dex(self):
         """
@@ -812,8 +1189,13 @@ class APK:
 
         :return: True if multiple dex found, otherwise False
         """
-        dexre = re.compile(r"^classes(\d+)?.dex$")
-        return len([instance for instance in self.get_files() if dexre.search(instance)]) > 1
+        count = 0
+        for name in self._get_file_names():
+            if _is_dex_name(name):
+                count += 1
+                if count > 1:
+                    return True
+        return False
 
     @DeprecationWarning
     def get_elements(self, tag_name, attribute, with_namespace=True):
@@ -823,14 +1205,13 @@ class APK:
         :param tag_name: a string which specify the tag name
         :param attribute: a string which specify the attribute
         """
+        if with_namespace:
+            attribute = _NS_NAMES[attribute]
         for i in self.xml:
             if self.xml[i] is None:
                 continue
-            for item in self.xml[i].findall('.//' + tag_name):
-                if with_namespace:
-                    value = item.get(self._ns(attribute))
-                else:
-                    value = item.get(attribute)
+            for item in self.xml[i].iterfind('.//' + tag_name):
+                value = item.get(attribute)
                 # There might be an attribute without the namespace
                 if value:
                     yield self._format_value(value)
@@ -842,15 +1223,12 @@ class APK:
         :param value:
         :return:
         """
-        if len(value) > 0:
-            if value[0] == ".":
-                value = self.package + value
-            else:
-                v_dot = value.find(".")
-                if v_dot == 0:
-                    value = self.package + "." + value
-                elif v_dot == -1:
-                    value = self.package + "." + value
+        if not value:
+            return value
+        if value[0] == ".":
+            return self.package + value
+        if "." not in value:
+            return self.package + "." + value
         return value
 
     @DeprecationWarning
@@ -864,6 +1242,10 @@ class APK:
         :type attribute: string
         :rtype: string
         """
+        ns_attribute = _NS_NAMES[attribute]
+        ns_attribute_filter = [
+            (_NS_NAMES[attr], val) for attr, val in attribute_filter.items()
+        ]
         for i in self.xml:
             if self.xml[i] is None:
                 continue
@@ -872,8 +1254,8 @@ class APK:
                 return None
             for item in tag:
                 skip_this_item = False
-                for attr, val in list(attribute_filter.items()):
-                    attr_val = item.get(self._ns(attr))
+                for attr, val in ns_attribute_filter:
+                    attr_val = item.get(attr)
                     if attr_val != val:
                         skip_this_item = True
                         break
@@ -881,7 +1263,7 @@ class APK:
                 if skip_this_item:
                     continue
 
-                value = item.get(self._ns(attribute))
+                value = item.get(ns_attribute)
 
                 if value is not None:
                     return value
@@ -899,14 +1281,25 @@ class APK:
         :param format_value: specify if the value needs to be formatted with packagename
         :type format_value: boolean
         """
-        tags = self.find_tags(tag_name, **attribute_filter)
-        for tag in tags:
-            value = tag.get(attribute) or tag.get(self._ns(attribute))
+        if attribute_filter:
+            values = self._find_all_attribute_value(tag_name, attribute, **attribute_filter)
+        else:
+            # Without filter, the same few lookups are done over and over
+            values = self._cached(
+                ("attribute", tag_name, attribute),
+                lambda: list(self._find_all_attribute_value(tag_name, attribute)))
+        for value in values:
+            if format_value:
+                yield self._format_value(value)
+            else:
+                yield value
+
+    def _find_all_attribute_value(self, tag_name, attribute, **attribute_filter):
+        ns_attribute = _NS_NAMES[attribute]
+        for tag in self.iter_tags(tag_name, **attribute_filter):
+            value = tag.get(attribute) or tag.get(ns_attribute)
             if value is not None:
-                if format_value:
-                    yield self._format_value(value)
-                else:
-                    yield value
+                yield value
 
     def get_attribute_value(
         self, tag_name, attribute, format_value=False, **attribute_filter
@@ -921,10 +1314,12 @@ class APK:
         :type format_value: boolean
         """
 
-        for value in self.get_all_attribute_value(
-                tag_name, attribute, format_value, **attribute_filter):
-            if value is not None:
-                return value
+        return next(
+            (value for value in self.get_all_attribute_value(
+                tag_name, attribute, format_value, **attribute_filter)
+             if value is not None),
+            None
+        )
 
     def get_value_from_tag(self, tag, attribute):
         """
@@ -960,7 +1355,7 @@ class APK:
 
         # TODO: figure out if both android:name and name tag exist which one to give preference:
         # currently we give preference for the namespace one and fallback to the un-namespaced
-        value = tag.get(self._ns(attribute))
+        value = tag.get(_NS_NAMES[attribute])
         if value is None:
             value = tag.get(attribute)
 
@@ -973,16 +1368,25 @@ class APK:
     def find_tags(self, tag_name, **attribute_filter):
         """
         Return a list of all the matched tags in all available xml
+
         :param tag: specify the tag name
         :type tag: string
         """
-        all_tags = [
-            self.find_tags_from_xml(
-                i, tag_name, **attribute_filter
-            )
-            for i in self.xml
-        ]
-        return [tag for tag_list in all_tags for tag in tag_list]
+        return list(self.iter_tags(tag_name, **attribute_filter))
+
+    def iter_tags(self, tag_name, **attribute_filter):
+        """
+        Yield all the matched tags in all available xml
+
+        Like :meth:`find_tags`, but the tags are generated lazily,
+        so callers which only need the first match can stop early.
+
+        :param tag: specify the tag name
+        :type tag: string
+        """
+        for i in self.xml:
+            for tag in self._iter_tags_from_xml(i, tag_name, **attribute_filter):
+                yield tag
 
     def find_tags_from_xml(
         self, xml_name, tag_name, **attribute_filter
@@ -994,21 +1398,49 @@ class APK:
         :param tag_name: specify the tag name
         :type tag_name: string
         """
+        return list(self._iter_tags_from_xml(xml_name, tag_name, **attribute_filter))
+
+    def _iter_tags_from_xml(self, xml_name, tag_name, **attribute_filter):
+        """
+        Yield all the matched tags in a specific xml, see :meth:`find_tags_from_xml`
+        """
         xml = self.xml[xml_name]
         if xml is None:
-            return []
+            return
+        filter_items = _compile_attribute_filter(attribute_filter)
         if xml.tag == tag_name:
-            if self.is_tag_matched(
-                xml.tag, **attribute_filter
-            ):
-                return [xml]
-            return []
-        tags = xml.findall(".//" + tag_name)
-        return [
-            tag for tag in tags if self.is_tag_matched(
-                tag, **attribute_filter
-            )
-        ]
+            if _is_attribute_filter_matched(xml, filter_items):
+                yield xml
+            return
+        if _PLAIN_TAG_RE.fullmatch(tag_name):
+            tags = self._get_tag_index(xml_name).get(tag_name, ())
+        else:
+            tags = xml.iterfind(".//" + tag_name)
+        for tag in tags:
+            if _is_attribute_filter_matched(tag, filter_items):
+                yield tag
+
+    def _get_tag_index(self, xml_name):
+        """
+        Return all the elements below the root of a specific xml, grouped by tag name.
+
+        The xml is walked only once, on the first call.
+        The elements of each tag are in document order, like with iterfind().
+
+        :param xml_name: specify from which xml to pick the tags from
+        :rtype: a dict of str to list of :class:`~lxml.etree.Element`
+        """
+        try:
+            return self._tag_index[xml_name]
+        except KeyError:
+            pass
+        xml = self.xml[xml_name]
+        index = {}
+        for tag in xml.iter(tag=etree.Element):
+            if tag is not xml:
+                index.setdefault(tag.tag, []).append(tag)
+        self._tag_index[xml_name] = index
+        return index
 
     def is_tag_matched(self, tag, **attribute_filter):
         r"""
@@ -1031,11 +1463,7 @@ class APK:
         """
         if len(attribute_filter) <= 0:
             return True
-        for attr, value in attribute_filter.items():
-            _value = self.get_value_from_tag(tag, attr)
-            if _value != value:
-                return False
-        return True
+        return _is_attribute_filter_matched(tag, _compile_attribute_filter(attribute_filter))
 
     def get_main_activities(self):
         """
@@ -1045,53 +1473,57 @@ class APK:
 
         :rtype: a set of str
         """
-        x = set()
-        y = set()
+        return set(self._cached("main_activities", lambda: list(self._iter_main_activities())))
+
+    def _iter_main_activities(self):
+        """
+        Yield the names of the main activities in document order
+
+        An activity is a main activity if it has both the MAIN action and
+        the LAUNCHER category, the manifest is walked only once.
+        """
+        ns_name = _NS_NAMES["name"]
+        seen = set()
 
         for i in self.xml:
             if self.xml[i] is None:
                 continue
-            activities_and_aliases = self.xml[i].findall(".//activity") + \
-                self.xml[i].findall(".//activity-alias")
-
-            for item in activities_and_aliases:
-                # Some applications have more than one MAIN activity.
-                # For example: paid and free content
-                activityEnabled = item.get(self._ns("enabled"))
-                if activityEnabled == "false":
+
+            # Some applications have more than one MAIN activity.
+            # For example: paid and free content
+            for item in _XP_ENABLED_ACTIVITIES(self.xml[i]):
+                mask = 0
+                for sitem in item.iter("action", "category"):
+                    val = sitem.get(ns_name)
+                    if sitem.tag == "action":
+                        if val == "android.intent.action.MAIN":
+                            mask |= 1
+                    elif val == "android.intent.category.LAUNCHER":
+                        mask |= 2
+                    if mask == 3:
+                        break
+                if mask != 3:
                     continue
 
-                for sitem in item.findall(".//action"):
-                    val = sitem.get(self._ns("name"))
-                    if val == "android.intent.action.MAIN":
-                        activity = item.get(self._ns("name"))
-                        if activity is not None:
-                            x.add(item.get(self._ns("name")))
-                        else:
-                            log.warning('Main activity without name')
-
-                for sitem in item.findall(".//category"):
-                    val = sitem.get(self._ns("name"))
-                    if val == "android.intent.category.LAUNCHER":
-                        activity = item.get(self._ns("name"))
-                        if activity is not None:
-                            y.add(item.get(self._ns("name")))
-                        else:
-                            log.warning('Launcher activity without name')
-
-        return x.intersection(y)
+                activity = item.get(ns_name)
+                if activity is None:
+                    log.warning('Main activity without name')
+                elif activity not in seen:
+                    seen.add(activity)
+                    yield activity
 
     def get_main_activity(self):
         """
         Return the name of the main activity
 
-        This value is read from the AndroidManifest.xml
+        This value is read from the AndroidManifest.xml.
+        If there are several main activities, the first one in the manifest is returned.
 
         :rtype: str
         """
-        activities = self.get_main_activities()
-        if len(activities) > 0:
-            return self._format_value(activities.pop())
+        activity = next(self._iter_main_activities(), None)
+        if activity is not None:
+            return self._format_value(activity)
         return None
 
     def get_activities(self):
@@ -1100,7 +1532,7 @@ class APK:
 
         :rtype: a list of str
         """
-        return list(self.get_all_attribute_value("activity", "name"))
+        return self._get_names("activity")
 
     def get_services(self):
         """
@@ -1108,7 +1540,7 @@ class APK:
 
         :rtype: a list of str
         """
-        return list(self.get_all_attribute_value("service", "name"))
+        return self._get_names("service")
 
     def get_receivers(self):
         """
@@ -1116,7 +1548,7 @@ class APK:
 
         :rtype: a list of string
         """
-        return list(self.get_all_attribute_value("receiver", "name"))
+        return self._get_names("receiver")
 
     def get_providers(self):
         """
@@ -1124,7 +1556,18 @@ class APK:
 
         :rtype: a list of string
         """
-        return list(self.get_all_attribute_value("provider", "name"))
+        return self._get_names("provider")
+
+    def _get_names(self, tag_name):
+        """
+        Return the formatted android:name attributes of all tag_name tags
+
+        The attribute values are cached as they are in the manifest, they
+        are formatted with the current package on each call.
+
+        :rtype: a new list of str
+        """
+        return list(self.get_all_attribute_value(tag_name, "name"))
 
     def get_intent_filters(self, itemtype, name):
         """
@@ -1138,19 +1581,33 @@ class APK:
         :param name: the `android:name` of the parent item, e.g. activity name
         :return: a dictionary with the keys `action` and `category` containing the `android:name` of those items
         """
+        # The names of the items are matched after formatting them with the package
+        d = self._cached(
+            ("intent_filters", itemtype, name, self.package),
+            self._find_intent_filters, itemtype, name)
+        return {key: list(value) for key, value in d.items()}
+
+    def _find_intent_filters(self, itemtype, name):
         d = {"action": [], "category": []}
+        # Names already in d, the lists keep the order of the manifest
+        seen = {"action": set(), "category": set()}
 
-        for i in self.xml:
-            # TODO: this can probably be solved using a single xpath
-            for item in self.xml[i].findall(".//" + itemtype):
-                if self._format_value(item.get(self._ns("name"))) == name:
-                    for sitem in item.findall(".//intent-filter"):
-                        for ssitem in sitem.findall("action"):
-                            if ssitem.get(self._ns("name")) not in d["action"]:
-                                d["action"].append(ssitem.get(self._ns("name")))
-                        for ssitem in sitem.findall("category"):
-                            if ssitem.get(self._ns("name")) not in d["category"]:
-                                d["category"].append(ssitem.get(self._ns("name")))
+        ns_name = _NS_NAMES["name"]
+
+        items = [
+            item
+            for raw_name, tags in self._get_items_by_name(itemtype).items()
+            if self._format_value(raw_name) == name
+            for item in tags
+        ]
+        for item in items:
+            for sitem in _XP_INTENT_FILTER(item):
+                for key in ("action", "category"):
+                    for ssitem in sitem.iterchildren(key):
+                        value = ssitem.get(ns_name)
+                        if value not in seen[key]:
+                            seen[key].add(value)
+                            d[key].append(value)
 
         if not d["action"]:
             del d["action"]
@@ -1160,6 +1617,28 @@ class APK:
 
         return d
 
+    def _get_items_by_name(self, itemtype):
+        """
+        Return the tags of a type in all xml files, by their android:name as in the xml
+
+        The names are not formatted, as the package may still change.
+
+        :rtype: a dict of str to a list of :class:`~lxml.etree.Element`, which must not be modified
+        """
+        try:
+            return self._items_by_name[itemtype]
+        except KeyError:
+            pass
+        ns_name = _NS_NAMES["name"]
+        items = OrderedDict()
+        for i in self.xml:
+            if self.xml[i] is None:
+                continue
+            for item in self._get_tag_index(i).get(itemtype, ()):
+                items.setdefault(item.get(ns_name), []).append(item)
+        self._items_by_name[itemtype] = items
+        return items
+
     def get_permissions(self):
         """
         Return permissions names declared in the AndroidManifest.xml.
@@ -1194,30 +1673,27 @@ class APK:
         WRITE_EXTERNAL_STORAGE = 'android.permission.WRITE_EXTERNAL_STORAGE'
 
         implied = []
+        permissions = set(self.permissions)
 
         implied_WRITE_EXTERNAL_STORAGE = False
         if target_sdk_version < 4:
-            if WRITE_EXTERNAL_STORAGE not in self.permissions:
+            if WRITE_EXTERNAL_STORAGE not in permissions:
                 implied.append([WRITE_EXTERNAL_STORAGE, None])
                 implied_WRITE_EXTERNAL_STORAGE = True
-            if READ_PHONE_STATE not in self.permissions:
+            if READ_PHONE_STATE not in permissions:
                 implied.append([READ_PHONE_STATE, None])
 
-        if (WRITE_EXTERNAL_STORAGE in self.permissions or implied_WRITE_EXTERNAL_STORAGE) \
-           and READ_EXTERNAL_STORAGE not in self.permissions:
-            maxSdkVersion = None
-            for name, version in self.uses_permissions:
-                if name == WRITE_EXTERNAL_STORAGE:
-                    maxSdkVersion = version
-                    break
+        if (WRITE_EXTERNAL_STORAGE in permissions or implied_WRITE_EXTERNAL_STORAGE) \
+           and READ_EXTERNAL_STORAGE not in permissions:
+            maxSdkVersion = self._get_uses_permissions_max_sdk().get(WRITE_EXTERNAL_STORAGE)
             implied.append([READ_EXTERNAL_STORAGE, maxSdkVersion])
 
         if target_sdk_version < 16:
-            if READ_CONTACTS in self.permissions \
-               and READ_CALL_LOG not in self.permissions:
+            if READ_CONTACTS in permissions \
+               and READ_CALL_LOG not in permissions:
                 implied.append([READ_CALL_LOG, None])
-            if WRITE_CONTACTS in self.permissions \
-               and WRITE_CALL_LOG not in self.permissions:
+            if WRITE_CONTACTS in permissions \
+               and WRITE_CALL_LOG not in permissions:
                 implied.append([WRITE_CALL_LOG, None])
 
         return implied
@@ -1228,17 +1704,16 @@ class APK:
 
         :rtype: dict of {permission: [protectionLevel, label, description]}
         """
-        l = {}
-
-        for i in self.permissions:
-            if i in self.permission_module:
-                x = self.permission_module[i]
-                l[i] = [x["protectionLevel"], x["label"], x["description"]]
-            else:
-                # FIXME: the permission might be signature, if it is defined by the app itself!
-                l[i] = ["normal", "Unknown permission from android reference",
-                        "Unknown permission from android reference"]
-        return l
+        permission_module = self.permission_module
+        # FIXME: the permission might be signature, if it is defined by the app itself!
+        return {
+            i: [permission_module[i]["protectionLevel"], permission_module[i]["label"],
+                permission_module[i]["description"]]
+            if i in permission_module else
+            ["normal", "Unknown permission from android reference",
+             "Unknown permission from android reference"]
+            for i in self.permissions
+        }
 
     @DeprecationWarning
     def get_requested_permissions(self):
@@ -1262,7 +1737,7 @@ class APK:
         aosp_permissions = []
         all_permissions = self.get_permissions()
         for perm in all_permissions:
-            if perm in list(self.permission_module.keys()):
+            if perm in self.permission_module:
                 aosp_permissions.append(perm)
         return aosp_permissions
 
@@ -1272,14 +1747,8 @@ class APK:
 
         :rtype: dictionary
         """
-        l = {}
-        for i in self.permissions:
-            try:
-                l[i] = self.permission_module[i]
-            except KeyError:
-                # if we have not found permission do nothing
-                continue
-        return l
+        permission_module = self.permission_module
+        return {i: permission_module[i] for i in self.permissions if i in permission_module}
 
     def get_requested_third_party_permissions(self):
         """
@@ -1290,7 +1759,7 @@ class APK:
         third_party_permissions = []
         all_permissions = self.get_permissions()
         for perm in all_permissions:
-            if perm not in list(self.permission_module.keys()):
+            if perm not in self.permission_module:
                 third_party_permissions.append(perm)
         return third_party_permissions
 
@@ -1310,13 +1779,19 @@ class APK:
         """
         return self.declared_permissions
 
+    def _get_uses_sdk(self, attribute):
+        """
+        Return an attribute of the uses-sdk tag, it is only looked up once
+        """
+        return self._cached(("uses-sdk", attribute), self.get_attribute_value, "uses-sdk", attribute)
+
     def get_max_sdk_version(self):
         """
             Return the android:maxSdkVersion attribute
 
             :rtype: string
         """
-        return self.get_attribute_value("uses-sdk", "maxSdkVersion")
+        return self._get_uses_sdk("maxSdkVersion")
 
     def get_min_sdk_version(self):
         """
@@ -1324,7 +1799,7 @@ class APK:
 
             :rtype: string
         """
-        return self.get_attribute_value("uses-sdk", "minSdkVersion")
+        return self._get_uses_sdk("minSdkVersion")
 
     def get_target_sdk_version(self):
         """
@@ -1332,7 +1807,7 @@ class APK:
 
             :rtype: string
         """
-        return self.get_attribute_value("uses-sdk", "targetSdkVersion")
+        return self._get_uses_sdk("targetSdkVersion")
 
     def get_effective_target_sdk_version(self):
         """
@@ -1344,6 +1819,9 @@ class APK:
 
             :rtype: int
         """
+        return self._cached("effective_target_sdk_version", self._find_effective_target_sdk_version)
+
+    def _find_effective_target_sdk_version(self):
         target_sdk_version = self.get_target_sdk_version()
         if not target_sdk_version:
             target_sdk_version = self.get_min_sdk_version()
@@ -1358,7 +1836,7 @@ class APK:
 
             :rtype: list
         """
-        return list(self.get_all_attribute_value("uses-library", "name"))
+        return self._get_names("uses-library")
 
     def get_features(self):
         """
@@ -1367,7 +1845,7 @@ class APK:
 
         :return: list
         """
-        return list(self.get_all_attribute_value("uses-feature", "name"))
+        return self._get_names("uses-feature")
 
     def is_wearable(self):
         """
@@ -1380,7 +1858,7 @@ class APK:
 
         :return: True if wearable, False otherwise
         """
-        return 'android.hardware.type.watch' in self.get_features()
+        return 'android.hardware.type.watch' in self._get_feature_required()
 
     def is_leanback(self):
         """
@@ -1389,7 +1867,7 @@ class APK:
 
         :return: True if leanback feature is used, false otherwise
         """
-        return 'android.software.leanback' in self.get_features()
+        return 'android.software.leanback' in self._get_feature_required()
 
     def is_androidtv(self):
         """
@@ -1399,10 +1877,29 @@ class APK:
 
         :return: True if 'android.hardware.touchscreen' is not required, False otherwise
         """
-        return self.get_attribute_value(
-            'uses-feature', 'name', required="false",
-            name="android.hardware.touchscreen"
-        ) == "android.hardware.touchscreen"
+        return "false" in self._get_feature_required().get("android.hardware.touchscreen", ())
+
+    def _get_feature_required(self):
+        """
+        Return the android:required values of the uses-feature tags, by android:name
+
+        The tags are only walked once, the feature checks are dictionary lookups.
+
+        :rtype: a dict of str to a set of str, which must not be modified
+        """
+        def build():
+            features = {}
+            for tag in self.iter_tags("uses-feature"):
+                name = tag.get(_NS_NAMES["name"])
+                if name is None:
+                    name = tag.get("name")
+                required = tag.get(_NS_NAMES["required"])
+                if required is None:
+                    required = tag.get("required")
+                features.setdefault(name, set()).add(required)
+            return features
+
+        return self._cached("feature_required", build)
 
     def new_zip(self, filename, deleted_files=None, new_files={}):
         """
@@ -1416,34 +1913,36 @@ class APK:
             :type deleted_files: None or a string
             :type new_files: a dictionnary (key:filename, value:content of the file)
         """
-        zout = zipfile.ZipFile(filename, 'w')
-
-        for item in self.zip.infolist():
-            # Block one: deleted_files, or deleted_files and new_files
-            if deleted_files is not None:
-                if re.match(deleted_files, item.filename) is None:
-                    # if the regex of deleted_files doesn't match the filename
-                    if new_files is not False:
-                        if item.filename in new_files:
-                            # and if the filename is in new_files
-                            zout.writestr(item, new_files[item.filename])
-                            continue
-                    # Otherwise, write the original file.
-                    buffer = self.zip.read(item.filename)
-                    zout.writestr(item, buffer)
-            # Block two: deleted_files is None, new_files is not empty
-            elif new_files is not False:
+        if deleted_files is not None:
+            deleted_files = re.compile(deleted_files)
+        if new_files is False:
+            new_files = {}
+
+        with zipfile.ZipFile(filename, 'w') as zout:
+            for item in self.zip.infolist():
+                # Skip the files matching the regex of deleted_files
+                if deleted_files is not None and deleted_files.match(item.filename) is not None:
+                    continue
                 if item.filename in new_files:
                     zout.writestr(item, new_files[item.filename])
                 else:
-                    buffer = self.zip.read(item.filename)
-                    zout.writestr(item, buffer)
-            # Block three: deleted_files is None, new_files is empty.
-            # Just write out the default zip
-            else:
-                buffer = self.zip.read(item.filename)
-                zout.writestr(item, buffer)
-        zout.close()
+                    # Otherwise, write the original file.
+                    self._copy_to_zip(item, zout)
+
+    def _copy_to_zip(self, item, zout):
+        """
+        Copy a file of the APK into another zip, in chunks of 1 MiB
+        instead of reading the whole file into memory
+
+        :param item: the :class:`zipfile.ZipInfo` of the file in the APK
+        :param zout: the :class:`zipfile.ZipFile` to write to
+        """
+        if sys.version_info < (3, 6):
+            # ZipFile.open() can only write since Python 3.6
+            zout.writestr(item, self.zip.read(item.filename))
+            return
+        with self.zip.open(item) as src, zout.open(item, 'w') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
 
     def get_android_manifest_axml(self):
         """
@@ -1477,11 +1976,13 @@ class APK:
         try:
             return self.arsc["resources.arsc"]
         except KeyError:
-            if "resources.arsc" not in self.zip.namelist():
+            try:
+                info = self.zip.getinfo("resources.arsc")
+            except KeyError:
                 # There is a rare case, that no resource file is supplied.
                 # Maybe it was added manually, thus we check here
                 return None
-            self.arsc["resources.arsc"] = ARSCParser(self.zip.read("resources.arsc"))
+            self.arsc["resources.arsc"] = ARSCParser(self.zip.read(info))
             return self.arsc["resources.arsc"]
 
     def get_certificate_der(self, filename):
@@ -1491,10 +1992,18 @@ class APK:
         :param filename: Signature filename in APK
         :returns: DER coded X.509 certificate as binary
         """
+        try:
+            return self._certificate_der[filename]
+        except KeyError:
+            pass
+
+        from asn1crypto import cms
+
         pkcs7message = self.get_file(filename)
 
         pkcs7obj = cms.ContentInfo.load(pkcs7message)
         cert = pkcs7obj['content']['certificates'][0].chosen.dump()
+        self._certificate_der[filename] = cert
         return cert
 
     def get_certificate(self, filename):
@@ -1504,6 +2013,8 @@ class APK:
         :param filename: filename of the signature file in the APK
         :returns: a :class:`Certificate` certificate
         """
+        from asn1crypto import x509
+
         cert = self.get_certificate_der(filename)
         certificate = x509.Certificate.load(cert)
 
@@ -1550,7 +2061,7 @@ class APK:
         return self._is_signed_v3
 
     def read_uint32_le(self, io_stream):
-        value, = unpack('<I', io_stream.read(4))
+        value, = _U32.unpack(io_stream.read(4))
         return value
 
     def parse_signatures_or_digests(self, digest_bytes):
@@ -1560,14 +2071,15 @@ class APK:
             return []
 
         digests = []
-        block = io.BytesIO(digest_bytes)
 
-        data_len = self.read_uint32_le(block)
-        while block.tell() < data_len:
+        data_len, = _U32.unpack_from(digest_bytes)
+        offset = 4
+        while offset < data_len:
 
-            algorithm_id = self.read_uint32_le(block)
-            digest_len = self.read_uint32_le(block)
-            digest = block.read(digest_len)
+            algorithm_id, digest_len = _U32_PAIR.unpack_from(digest_bytes, offset)
+            offset += 8
+            digest = digest_bytes[offset:offset + digest_len]
+            offset += len(digest)
 
             digests.append((algorithm_id, digest))
 
@@ -1585,67 +2097,60 @@ class APK:
         # * There should be again the size_of_block
         # * Now we can read the Key-Values
         # * IDs with an unknown value should be ignored.
-        f = io.BytesIO(self.get_raw())
+        if self.__raw is not None:
+            self._parse_v2_v3_signature(self.__raw)
+            return
+
+        # Only the end of the file is needed, thus it is mapped
+        # instead of read into memory as a whole
+        with open(self.filename, "rb") as fd, \
+                mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self._parse_v2_v3_signature(data)
+
+    def _parse_v2_v3_signature(self, data):
+        """
+        Find the APK Signing Block in the APK and store its ID-value pairs in _v2_blocks
 
+        :param data: the content of the APK, as bytes or mmap
+        """
         size_central = None
         offset_central = None
 
-        # Go to the end
-        f.seek(-1, io.SEEK_END)
-        # we know the minimal length for the central dir is 16+4+2
-        f.seek(-20, io.SEEK_CUR)
-
-        while f.tell() > 0:
-            f.seek(-1, io.SEEK_CUR)
-            r, = unpack('<4s', f.read(4))
-            if r == self._PK_END_OF_CENTRAL_DIR:
-                # Read central dir
-                this_disk, disk_central, this_entries, total_entries, \
-                size_central, offset_central = unpack('<HHHHII', f.read(16))
-                # TODO according to the standard we need to check if the
-                # end of central directory is the last item in the zip file
-                # TODO We also need to check if the central dir is exactly
-                # before the end of central dir...
-
-                # These things should not happen for APKs
-                if this_disk != 0:
-                    raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
-                if disk_central != 0:
-                    raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
-                break
-            f.seek(-4, io.SEEK_CUR)
+        # Search the End of Central Directory backwards from the end,
+        # we know the minimal length for the central dir is 16+4+2.
+        # It can only be followed by its comment, so a broken APK
+        # does not need to be searched as a whole.
+        eocd = data.rfind(
+            self._PK_END_OF_CENTRAL_DIR,
+            max(0, len(data) - _ZIP_EOCD_SEARCH_SIZE), len(data) - 18)
+        if eocd != -1:
+            # Read central dir
+            this_disk, disk_central, this_entries, total_entries, \
+                size_central, offset_central = _EOCD.unpack_from(data, eocd + 4)
+            # TODO according to the standard we need to check if the
+            # end of central directory is the last item in the zip file
+            # TODO We also need to check if the central dir is exactly
+            # before the end of central dir...
+
+            # These things should not happen for APKs
+            if this_disk != 0:
+                raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
+            if disk_central != 0:
+                raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
 
         if not offset_central:
             return
 
-        f.seek(offset_central)
-        r, = unpack('<4s', f.read(4))
-        f.seek(-4, io.SEEK_CUR)
-        if r != self._PK_CENTRAL_DIR:
+        if data[offset_central:offset_central + 4] != self._PK_CENTRAL_DIR:
             raise BrokenAPKError("No Central Dir at specified offset")
 
-        # Go back and check if we have a magic
-        end_offset = f.tell()
-        f.seek(-24, io.SEEK_CUR)
-        size_of_block, magic = unpack('<Q16s', f.read(24))
-
         self._is_signed_v2 = False
         self._is_signed_v3 = False
 
-        if magic != self._APK_SIG_MAGIC:
+        blocks = _parse_signing_block(data, offset_central)
+        if blocks is None:
             return
-
-        # go back size_of_blocks + 8 and read size_of_block again
-        f.seek(-(size_of_block + 8), io.SEEK_CUR)
-        size_of_block_start, = unpack("<Q", f.read(8))
-        if size_of_block_start != size_of_block:
-            raise BrokenAPKError("Sizes at beginning and and does not match!")
-
-        # Store all blocks
-        while f.tell() < end_offset - 24:
-            size, key = unpack('<QI', f.read(12))
-            value = f.read(size - 4)
-            self._v2_blocks[key] = value
+        self._v2_blocks.update(blocks)
 
         # Test if a signature is found
         if self._APK_SIG_KEY_V2_SIGNATURE in self._v2_blocks:
@@ -1654,10 +2159,9 @@ class APK:
         if self._APK_SIG_KEY_V3_SIGNATURE in self._v2_blocks:
             self._is_signed_v3 = True
 
-
     def parse_v3_signing_block(self):
         """
-        Parse the V2 signing block and extract all features
+        Parse the V3 signing block and extract all features
         """
 
         self._v3_signing_data = []
@@ -1666,93 +2170,8 @@ class APK:
         if not self.is_signed_v3():
             return
 
-        block_bytes = self._v2_blocks[self._APK_SIG_KEY_V3_SIGNATURE]
-        block = io.BytesIO(block_bytes)
-        view = block.getvalue()
-
-        # V3 signature Block data format:
-        #
-        # * signer:
-        #    * signed data:
-        #        * digests:
-        #            * signature algorithm ID (uint32)
-        #            * digest (length-prefixed)
-        #        * certificates
-        #        * minSDK
-        #        * maxSDK
-        #        * additional attributes
-        #    * minSDK
-        #    * maxSDK
-        #    * signatures
-        #    * publickey
-        size_sequence = self.read_uint32_le(block)
-        if size_sequence + 4 != len(block_bytes):
-            raise BrokenAPKError("size of sequence and blocksize does not match")
-
-        while block.tell() < len(block_bytes):
-            off_signer = block.tell()
-            size_signer = self.read_uint32_le(block)
-
-            # read whole signed data, since we might to parse
-            # content within the signed data, and mess up offset
-            len_signed_data = self.read_uint32_le(block)
-            signed_data_bytes = block.read(len_signed_data)
-            signed_data = io.BytesIO(signed_data_bytes)
-
-            # Digests
-            len_digests = self.read_uint32_le(signed_data)
-            raw_digests = signed_data.read(len_digests)
-            digests = self.parse_signatures_or_digests(raw_digests)
-
-
-            # Certs
-            certs = []
-            len_certs = self.read_uint32_le(signed_data)
-            start_certs = signed_data.tell()
-            while signed_data.tell() < start_certs + len_certs:
-
-                len_cert = self.read_uint32_le(signed_data)
-                cert = signed_data.read(len_cert)
-                certs.append(cert)
-
-            # versions
-            signed_data_min_sdk = self.read_uint32_le(signed_data)
-            signed_data_max_sdk = self.read_uint32_le(signed_data)
-
-            # Addional attributes
-            len_attr = self.read_uint32_le(signed_data)
-            attr = signed_data.read(len_attr)
-
-            signed_data_object = APKV3SignedData()
-            signed_data_object._bytes = signed_data_bytes
-            signed_data_object.digests = digests
-            signed_data_object.certificates = certs
-            signed_data_object.additional_attributes = attr
-            signed_data_object.minSDK = signed_data_min_sdk
-            signed_data_object.maxSDK = signed_data_max_sdk
-
-            # versions (should be the same as signed data's versions)
-            signer_min_sdk = self.read_uint32_le(block)
-            signer_max_sdk = self.read_uint32_le(block)
-
-            # Signatures
-            len_sigs = self.read_uint32_le(block)
-            raw_sigs = block.read(len_sigs)
-            sigs = self.parse_signatures_or_digests(raw_sigs)
-
-            # PublicKey
-            len_publickey = self.read_uint32_le(block)
-            publickey = block.read(len_publickey)
-
-            signer = APKV3Signer()
-            signer._bytes = view[off_signer:off_signer+size_signer]
-            signer.signed_data = signed_data_object
-            signer.signatures = sigs
-            signer.public_key = publickey
-            signer.minSDK = signer_min_sdk
-            signer.maxSDK = signer_max_sdk
-
-            self._v3_signing_data.append(signer)
+        self._v3_signing_data = self._parse_signers(
+            self._v2_blocks[self._APK_SIG_KEY_V3_SIGNATURE], v3=True)
 
     def parse_v2_signing_block(self):
         """
@@ -1765,11 +2184,19 @@ class APK:
         if not self.is_signed_v2():
             return
 
-        block_bytes = self._v2_blocks[self._APK_SIG_KEY_V2_SIGNATURE]
-        block = io.BytesIO(block_bytes)
-        view = block.getvalue()
+        self._v2_signing_data = self._parse_signers(
+            self._v2_blocks[self._APK_SIG_KEY_V2_SIGNATURE], v3=False)
 
-        # V2 signature Block data format:
+    def _parse_signers(self, block_bytes, v3):
+        """
+        Parse the signers of a V2 or V3 signature block
+
+        :param block_bytes: the value of the signature block
+        :param v3: True for a V3 block, which has the SDK versions in the
+            signed data and the signer
+        :rtype: list of :class:`APKV2Signer` or :class:`APKV3Signer`
+        """
+        # V2 and V3 signature Block data format:
         #
         # * signer:
         #    * signed data:
@@ -1777,64 +2204,84 @@ class APK:
         #            * signature algorithm ID (uint32)
         #            * digest (length-prefixed)
         #        * certificates
+        #        * minSDK (V3 only)
+        #        * maxSDK (V3 only)
         #        * additional attributes
+        #    * minSDK (V3 only)
+        #    * maxSDK (V3 only)
         #    * signatures
         #    * publickey
-
-        size_sequence = self.read_uint32_le(block)
+        #
+        # The block is walked with offsets, the slices are the only copies.
+        size_sequence, = _U32.unpack_from(block_bytes)
         if size_sequence + 4 != len(block_bytes):
             raise BrokenAPKError("size of sequence and blocksize does not match")
 
-        while block.tell() < len(block_bytes):
-            off_signer = block.tell()
-            size_signer = self.read_uint32_le(block)
+        signers = []
+        offset = 4
+        while offset < len(block_bytes):
+            off_signer = offset
+            size_signer, = _U32.unpack_from(block_bytes, offset)
+            offset += 4
 
             # read whole signed data, since we might to parse
             # content within the signed data, and mess up offset
-            len_signed_data = self.read_uint32_le(block)
-            signed_data_bytes = block.read(len_signed_data)
-            signed_data = io.BytesIO(signed_data_bytes)
+            signed_data_bytes, offset = _read_length_prefixed(block_bytes, offset)
 
             # Digests
-            len_digests = self.read_uint32_le(signed_data)
-            raw_digests = signed_data.read(len_digests)
+            raw_digests, sd_offset = _read_length_prefixed(signed_data_bytes, 0)
             digests = self.parse_signatures_or_digests(raw_digests)
 
             # Certs
             certs = []
-            len_certs = self.read_uint32_le(signed_data)
-            start_certs = signed_data.tell()
-            while signed_data.tell() < start_certs + len_certs:
-                len_cert = self.read_uint32_le(signed_data)
-                cert = signed_data.read(len_cert)
+            len_certs, = _U32.unpack_from(signed_data_bytes, sd_offset)
+            sd_offset += 4
+            end_certs = sd_offset + len_certs
+            while sd_offset < end_certs:
+                cert, sd_offset = _read_length_prefixed(signed_data_bytes, sd_offset)
                 certs.append(cert)
 
+            if v3:
+                signed_data_object = APKV3SignedData()
+                # versions
+                signed_data_object.minSDK, signed_data_object.maxSDK = \
+                    _U32_PAIR.unpack_from(signed_data_bytes, sd_offset)
+                sd_offset += 8
+            else:
+                signed_data_object = APKV2SignedData()
+
             # Additional attributes
-            len_attr = self.read_uint32_le(signed_data)
-            attributes = signed_data.read(len_attr)
+            attributes, sd_offset = _read_length_prefixed(signed_data_bytes, sd_offset)
 
-            signed_data_object = APKV2SignedData()
+            signed_data_object._cert_cache = self._asn1_objects
             signed_data_object._bytes = signed_data_bytes
             signed_data_object.digests = digests
             signed_data_object.certificates = certs
             signed_data_object.additional_attributes = attributes
 
+            if v3:
+                signer = APKV3Signer()
+                # versions (should be the same as signed data's versions)
+                signer.minSDK, signer.maxSDK = _U32_PAIR.unpack_from(block_bytes, offset)
+                offset += 8
+            else:
+                signer = APKV2Signer()
+
             # Signatures
-            len_sigs = self.read_uint32_le(block)
-            raw_sigs = block.read(len_sigs)
+            raw_sigs, offset = _read_length_prefixed(block_bytes, offset)
             sigs = self.parse_signatures_or_digests(raw_sigs)
 
             # PublicKey
-            len_publickey = self.read_uint32_le(block)
-            publickey = block.read(len_publickey)
+            publickey, offset = _read_length_prefixed(block_bytes, offset)
 
-            signer = APKV2Signer()
-            signer._bytes = view[off_signer:off_signer+size_signer]
+            signer._bytes = block_bytes[off_signer:off_signer+size_signer]
             signer.signed_data = signed_data_object
             signer.signatures = sigs
             signer.public_key = publickey
 
-            self._v2_signing_data.append(signer)
+            signers.append(signer)
+
+        return signers
 
     def get_public_keys_der_v3(self):
         """
@@ -1844,12 +2291,7 @@ class APK:
         if self._v3_signing_data is None:
             self.parse_v3_signing_block()
 
-        public_keys = []
-
-        for signer in self._v3_signing_data:
-            public_keys.append(signer.public_key)
-
-        return public_keys
+        return [signer.public_key for signer in self._v3_signing_data]
 
     def get_public_keys_der_v2(self):
         """
@@ -1859,12 +2301,7 @@ class APK:
         if self._v2_signing_data is None:
             self.parse_v2_signing_block()
 
-        public_keys = []
-
-        for signer in self._v2_signing_data:
-            public_keys.append(signer.public_key)
-
-        return public_keys
+        return [signer.public_key for signer in self._v2_signing_data]
 
     def get_certificates_der_v3(self):
         """
@@ -1875,9 +2312,8 @@ class APK:
             self.parse_v3_signing_block()
 
         certs = []
-        for signed_data in [signer.signed_data for signer in self._v3_signing_data]:
-            for cert in signed_data.certificates:
-                certs.append(cert)
+        for signer in self._v3_signing_data:
+            certs.extend(signer.signed_data.certificates)
 
         return certs
 
@@ -1890,25 +2326,51 @@ class APK:
             self.parse_v2_signing_block()
 
         certs = []
-        for signed_data in [signer.signed_data for signer in self._v2_signing_data]:
-            for cert in signed_data.certificates:
-                certs.append(cert)
+        for signer in self._v2_signing_data:
+            certs.extend(signer.signed_data.certificates)
 
         return certs
 
+    def _load_asn1(self, load, ders):
+        """
+        Return the objects loaded from a list of DER coded values,
+        each value is only loaded once.
+
+        The signatures do not change, the objects are kept on the APK
+        so asn1crypto does not parse them again on each call. The signed
+        data of the v2 and v3 signers print their certificates from the
+        same cache.
+
+        :param load: the load function of an asn1crypto type
+        :param ders: list of DER coded values
+        :rtype: a new list of the cached objects
+        """
+        objects = []
+        for der in ders:
+            try:
+                obj = self._asn1_objects[der]
+            except KeyError:
+                obj = self._asn1_objects[der] = load(der)
+            objects.append(obj)
+        return objects
+
     def get_public_keys_v3(self):
         """
         Return a list of :class:`asn1crypto.keys.PublicKeyInfo` which are found
         in the v3 signing block.
         """
-        return [ keys.PublicKeyInfo.load(pkey) for pkey in self.get_public_keys_der_v3()]
+        from asn1crypto import keys
+
+        return self._load_asn1(keys.PublicKeyInfo.load, self.get_public_keys_der_v3())
 
     def get_public_keys_v2(self):
         """
         Return a list of :class:`asn1crypto.keys.PublicKeyInfo` which are found
         in the v2 signing block.
         """
-        return [ keys.PublicKeyInfo.load(pkey) for pkey in self.get_public_keys_der_v2()]
+        from asn1crypto import keys
+
+        return self._load_asn1(keys.PublicKeyInfo.load, self.get_public_keys_der_v2())
 
     def get_certificates_v3(self):
         """
@@ -1917,7 +2379,9 @@ class APK:
         Note that we simply extract all certificates regardless of the signer.
         Therefore this is just a list of all certificates found in all signers.
         """
-        return [ x509.Certificate.load(cert) for cert in self.get_certificates_der_v3()]
+        from asn1crypto import x509
+
+        return self._load_asn1(x509.Certificate.load, self.get_certificates_der_v3())
 
     def get_certificates_v2(self):
         """
@@ -1926,7 +2390,9 @@ class APK:
         Note that we simply extract all certificates regardless of the signer.
         Therefore this is just a list of all certificates found in all signers.
         """
-        return [ x509.Certificate.load(cert) for cert in self.get_certificates_der_v2()]
+        from asn1crypto import x509
+
+        return self._load_asn1(x509.Certificate.load, self.get_certificates_der_v2())
 
     def get_certificates_v1(self):
         """
@@ -1935,11 +2401,11 @@ class APK:
         Note that we simply extract all certificates regardless of the signer.
         Therefore this is just a list of all certificates found in all signers.
         """
-        certs = []
-        for x in self.get_signature_names():
-            certs.append(x509.Certificate.load(self.get_certificate_der(x)))
+        from asn1crypto import x509
 
-        return certs
+        return self._load_asn1(
+            x509.Certificate.load,
+            [self.get_certificate_der(x) for x in self._get_signature_names()])
 
     def get_certificates(self):
         """
@@ -1948,11 +2414,12 @@ class APK:
         Note that we simply extract all certificates regardless of the signer.
         Therefore this is just a list of all certificates found in all signers.
         """
-        fps = []
+        fps = set()
         certs = []
         for x in self.get_certificates_v1() + self.get_certificates_v2() + self.get_certificates_v3():
-            if x.sha256 not in fps:
-                fps.append(x.sha256)
+            fp = x.sha256
+            if fp not in fps:
+                fps.add(fp)
                 certs.append(x)
         return certs
 
@@ -1960,8 +2427,9 @@ class APK:
         """
             Return the name of the first signature file found.
         """
-        if self.get_signature_names():
-            return self.get_signature_names()[0]
+        signature_names = self._get_signature_names()
+        if signature_names:
+            return signature_names[0]
         else:
             # Unsigned APK
             return None
@@ -1973,16 +2441,27 @@ class APK:
 
         :rtype: List of filenames matching a Signature
         """
-        signature_expr = re.compile(r"^(META-INF/)(.*)(\.RSA|\.EC|\.DSA)$")
+        return list(self._get_signature_names())
+
+    def _get_signature_names(self):
+        """
+        Return the signature file names, the files are only searched once.
+
+        :rtype: a list of str, which must not be modified
+        """
+        if self._signature_names is not None:
+            return self._signature_names
+
+        files = set(self._get_file_names())
         signatures = []
 
-        for i in self.get_files():
-            if signature_expr.search(i):
-                if "{}.SF".format(i.rsplit(".", 1)[0]) in self.get_files():
-                    signatures.append(i)
-                else:
-                    log.warning("v1 signature file {} missing .SF file - Partial signature!".format(i))
+        for i in self._get_signature_files():
+            if i.rpartition(".")[0] + ".SF" in files:
+                signatures.append(i)
+            else:
+                log.warning("v1 signature file {} missing .SF file - Partial signature!".format(i))
 
+        self._signature_names = signatures
         return signatures
 
     def get_signature(self):
@@ -1992,10 +2471,9 @@ class APK:
 
         :rtype: First signature name or None if not signed
         """
-        if self.get_signatures():
-            return self.get_signatures()[0]
-        else:
-            return None
+        for i in self._get_signature_files():
+            return self.get_file(i)
+        return None
 
     def get_signatures(self):
         """
@@ -2004,21 +2482,28 @@ class APK:
 
         :rtype: list of bytes
         """
-        signature_expr = re.compile(r"^(META-INF/)(.*)(\.RSA|\.EC|\.DSA)$")
-        signature_datas = []
+        return [self.get_file(i) for i in self._get_signature_files()]
 
-        for i in self.get_files():
-            if signature_expr.search(i):
-                signature_datas.append(self.get_file(i))
+    def _get_signature_files(self):
+        """
+        Return the names of the signature block files in META-INF,
+        whether or not their .SF file exists. The files are only searched once.
 
-        return signature_datas
+        :rtype: a list of str, which must not be modified
+        """
+        if self._signature_files is None:
+            self._signature_files = [
+                i for i in self._get_file_names()
+                if i.startswith("META-INF/") and i.endswith(_SIGNATURE_BLOCK_EXTENSIONS)
+            ]
+        return self._signature_files
 
 
     def show(self):
         self.get_files_types()
 
         print("FILES: ")
-        for i in self.get_files():
+        for i in self._get_file_names():
             try:
                 print("\t", i, self._files[i], "%x" % self.files_crc32[i])
             except KeyError:
@@ -2120,9 +2605,10 @@ def ensure_final_value(packageName, arsc, value):
     """
     if value:
         returnValue = value
-        if value[0] == '@':
-            try:  # can be a literal value or a resId
-                res_id = int('0x' + value[1:], 16)
+        # can be a literal value or a resId
+        if value[0] == '@' and _RES_ID_RE.fullmatch(value, 1):
+            try:
+                res_id = int(value[1:], 16)
                 res_id = arsc.get_id(packageName, res_id)[1]
                 returnValue = arsc.get_string(packageName, res_id)[1]
             except (ValueError, TypeError):
@@ -2131,6 +2617,10 @@ def ensure_final_value(packageName, arsc, value):
     return ''
 
 
+# The attributes of the <manifest> tag read by get_apkid
+_APKID_ATTRIBUTES = frozenset(('package', 'versionCode', 'versionName'))
+
+
 def get_apkid(apkfile):
     """Read (appid, versionCode, versionName) from an APK
 
@@ -2144,9 +2634,8 @@ def get_apkid(apkfile):
     if not os.path.exists(apkfile):
         log.error("'{apkfile}' does not exist!".format(apkfile=apkfile))
 
-    appid = None
-    versionCode = None
-    versionName = None
+    # The first value of each wanted attribute, by name
+    values = {}
     with zipfile.ZipFile(apkfile) as apk:
         with apk.open('AndroidManifest.xml') as manifest:
             axml = AXMLParser(manifest.read())
@@ -2157,18 +2646,16 @@ def get_apkid(apkfile):
                 if _type == const.START_TAG:
                     for i in range(0, axml.getAttributeCount()):
                         name = axml.getAttributeName(i)
+                        if name not in _APKID_ATTRIBUTES or name in values:
+                            # Do not format the values which are not returned
+                            continue
                         _type = axml.getAttributeValueType(i)
                         _data = axml.getAttributeValueData(i)
-                        value = format_value(_type, _data, lambda _: axml.getAttributeValue(i))
-                        if appid is None and name == 'package':
-                            appid = value
-                        elif versionCode is None and name == 'versionCode':
-                            if value.startswith('0x'):
-                                versionCode = str(int(value, 16))
-                            else:
-                                versionCode = value
-                        elif versionName is None and name == 'versionName':
-                            versionName = value
+                        values[name] = format_value(_type, _data, lambda _: axml.getAttributeValue(i))
+
+                        if len(values) == len(_APKID_ATTRIBUTES):
+                            # No need to decode the remaining attributes
+                            break
 
                     if axml.name == 'manifest':
                         break
@@ -2178,6 +2665,12 @@ def get_apkid(apkfile):
                         'AndroidManifest.xml'.format(path=apkfile)
                     )
 
+    appid = values.get('package')
+    versionCode = values.get('versionCode')
+    if versionCode is not None and versionCode.startswith('0x'):
+        versionCode = str(int(versionCode, 16))
+    versionName = values.get('versionName')
+
     if not versionName or versionName[0] == '@':
         a = APK(apkfile)
         versionName = ensure_final_value(a.package, a.get_android_resources(), a.get_androidversion_name())
@@ -2198,18 +2691,16 @@ def is_android_raw(raw):
     # as you also want to analyze unsigned APKs...
     # AndroidManifest.xml should be in every APK.
     # classes.dex and resources.arsc are not required!
-    # if raw[0:2] == b"PK" and b'META-INF/MANIFEST.MF' in raw:
-    # TODO this check might be still invalid. A ZIP file with stored APK inside would match as well.
-    # probably it would be better to rewrite this and add more sanity checks.
-    if raw[0:2] == b"PK" and b'AndroidManifest.xml' in raw:
-        val = "APK"
-    elif raw[0:3] == b"dex":
-        val = "DEX"
-    elif raw[0:3] == b"dey":
-        val = "DEY"
-    elif raw[0:4] == b"\x03\x00\x08\x00" or raw[0:4] == b"\x00\x00\x08\x00":
-        val = "AXML"
-    elif raw[0:4] == b"\x02\x00\x0C\x00":
-        val = "ARSC"
+    # The entry is looked up in the central directory, thus a ZIP file with
+    # a stored APK inside does not match. If the central directory can not be
+    # parsed, we fall back to search the whole file.
+    if raw[0:2] == b"PK":
+        has_manifest = _zip_has_entry(raw, b"AndroidManifest.xml")
+        if has_manifest is None:
+            has_manifest = b"AndroidManifest.xml" in raw
+        if has_manifest:
+            val = "APK"
+    else:
+        val = _RAW_MAGIC.get(bytes(raw[0:3])) or _RAW_MAGIC.get(bytes(raw[0:4]))
 
     return val
@@ -1,13 +1,10 @@
 import io
 import os.path
-from xml.dom.pulldom import SAX2DOM
+import warnings
 from zipfile import ZipFile
 import pyaxmlparser.constants as const
 from struct import unpack, pack
 
-import lxml.sax
-import asn1crypto
-
 
 NS_ANDROID_URI = 'http://schemas.android.com/apk/res/android'
 NS_ANDROID = '{http://schemas.android.com/apk/res/android}'
@@ -15,6 +12,18 @@ RADIX_MULTS = [0.00390625, 3.051758E-005, 1.192093E-007, 4.656613E-010]
 
 
 def parse_lxml_dom(tree):
+    """
+    Deprecated: convert an lxml tree into a minidom document.
+
+    The manifest is an lxml tree already, which supports find(), iter() and xpath().
+    The conversion runs a Python callback for every node, thus it is slow.
+    """
+    warnings.warn(
+        "parse_lxml_dom() is deprecated, use the lxml tree directly",
+        DeprecationWarning, stacklevel=2)
+    import lxml.sax
+    from xml.dom.pulldom import SAX2DOM
+
     handler = SAX2DOM()
     lxml.sax.saxify(tree, handler)
     return handler.document
@@ -120,7 +129,9 @@ def get_certificate_name_string(name, short=False, delimiter=', '):
     :type delimiter: str
     :rtype: str
     """
-    if isinstance(name, asn1crypto.x509.Name):
+    from asn1crypto import x509
+
+    if isinstance(name, x509.Name):
         name = name.native
 
     # For the shortform, we have a lookup table
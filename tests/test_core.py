@@ -0,0 +1,197 @@
+import io
+import os.path
+import pickle
+import struct
+import zipfile
+
+from pyaxmlparser.core import APK, ensure_final_value, is_android_raw
+
+
+test_apk = 'tests/test_apk/'
+
+
+def build_apk(extra_files=None):
+    """
+    Build an unsigned APK in memory from the files in the test_apk folder
+    """
+    buff = io.BytesIO()
+    with zipfile.ZipFile(buff, 'w', zipfile.ZIP_DEFLATED) as apk:
+        for name in ('AndroidManifest.xml', 'resources.arsc'):
+            with open(os.path.join(test_apk, name), 'rb') as fd:
+                apk.writestr(name, fd.read())
+        for name, data in (extra_files or {}).items():
+            apk.writestr(name, data)
+    return buff.getvalue()
+
+
+def read_test_file(name):
+    with open(os.path.join(test_apk, name), 'rb') as fd:
+        return fd.read()
+
+
+def length_prefixed(*values):
+    return b''.join(struct.pack('<I', len(value)) + value for value in values)
+
+
+def build_signer(certs, public_key, sdks=None, attributes=b''):
+    """
+    Build a V2 signer, or a V3 signer when the (minSDK, maxSDK) pair is given
+    """
+    versions = struct.pack('<II', *sdks) if sdks else b''
+    digests = length_prefixed(struct.pack('<I', 0x0103) + length_prefixed(b'\x11' * 32))
+    signatures = length_prefixed(struct.pack('<I', 0x0103) + length_prefixed(b'\x22' * 256))
+    signed_data = (length_prefixed(digests, length_prefixed(*certs)) + versions +
+                   length_prefixed(attributes))
+    return length_prefixed(length_prefixed(signed_data) + versions + length_prefixed(signatures, public_key))
+
+
+def build_signed_apk(v2_signers, v3_signers):
+    """
+    Insert an APK Signing Block with the given signers right before the central directory
+    """
+    data = build_apk()
+    eocd = data.rfind(b'PK\x05\x06')
+    offset_central, = struct.unpack_from('<I', data, eocd + 16)
+    pairs = b''
+    for key, signers in ((0x7109871a, v2_signers), (0xf05368c0, v3_signers)):
+        value = length_prefixed(b''.join(signers))
+        pairs += struct.pack('<QI', len(value) + 4, key) + value
+    size = struct.pack('<Q', len(pairs) + 24)
+    block = size + pairs + size + b'APK Sig Block 42'
+    return (data[:offset_central] + block + data[offset_central:eocd + 16] +
+            struct.pack('<I', offset_central + len(block)) + data[eocd + 20:])
+
+
+def test_is_android_raw_apk():
+    assert is_android_raw(build_apk()) == "APK"
+
+
+def test_is_android_raw_zip_with_stored_apk():
+    buff = io.BytesIO()
+    with zipfile.ZipFile(buff, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('app.apk', build_apk())
+    assert is_android_raw(buff.getvalue()) is None
+
+
+def test_is_android_raw_broken_zip():
+    # No central directory, the whole content is searched instead
+    assert is_android_raw(b"PK\x03\x04AndroidManifest.xml") == "APK"
+    assert is_android_raw(b"PK\x03\x04") is None
+
+
+def test_ensure_final_value_without_resource_id():
+    apk = APK(build_apk(), raw=True)
+    arsc = apk.get_android_resources()
+    # 7F090044 is the resource id of the application label
+    assert ensure_final_value(apk.package, arsc, '@7F090044') == 'Evie'
+    for value in ('@0x7F090044', '@ 7F090044', '@+7F090044', '@7F09_0044', '@-1', '@string/app_name', 'name'):
+        assert ensure_final_value(apk.package, arsc, value) == value
+    assert ensure_final_value(apk.package, arsc, None) == ''
+
+
+def test_pickle_apk_from_path(tmpdir):
+    path = tmpdir.join('test.apk')
+    path.write_binary(build_apk())
+    apk = APK(str(path))
+    apk.get_raw()
+    # the cached lookups on the manifest must not keep lxml elements around
+    assert apk.get_intent_filters('activity', apk.get_main_activity())
+
+    apk.__getstate__()
+    assert apk.zip is not None
+
+    restored = pickle.loads(pickle.dumps(apk))
+    assert restored.get_package() == apk.get_package()
+    assert restored.get_permissions() == apk.get_permissions()
+    assert restored.get_file('AndroidManifest.xml') == apk.get_file('AndroidManifest.xml')
+
+    # Without a path to reopen, the loaded content is used
+    data = pickle.dumps(apk)
+    path.remove()
+    restored = pickle.loads(data)
+    assert restored.get_file('AndroidManifest.xml') == apk.get_file('AndroidManifest.xml')
+
+
+def test_cached_manifest_lookups_return_copies():
+    apk = APK(build_apk(), raw=True)
+    activities = apk.get_activities()
+    activities.append('foo')
+    assert 'foo' not in apk.get_activities()
+
+    main_activities = apk.get_main_activities()
+    main_activities.clear()
+    assert apk.get_main_activities()
+
+    assert apk.find_tags_from_xml('AndroidManifest.xml', 'nonexistent') == []
+
+
+def test_get_files_crc32_verify():
+    apk = APK(build_apk({'assets/data.bin': b'\x00' * 1024}), raw=True)
+    stored = dict(apk.get_files_crc32())
+    assert stored['assets/data.bin'] == zipfile.crc32(b'\x00' * 1024)
+    assert apk.get_files_crc32(verify=True) == stored
+
+    # Overwrite the CRC32 of the file in the central directory
+    data = bytearray(build_apk({'assets/data.bin': b'\x00' * 1024}))
+    entry = data.rfind(b'PK\x01\x02', 0, data.rfind(b'assets/data.bin'))
+    struct.pack_into('<I', data, entry + 16, 0x12345678)
+    apk = APK(bytes(data), raw=True)
+    assert apk.get_files_crc32()['assets/data.bin'] == 0x12345678
+    assert apk.get_files_crc32(verify=True)['assets/data.bin'] == zipfile.crc32(b'\x00' * 1024)
+
+
+def test_get_files_types_after_get_raw(tmpdir):
+    path = tmpdir.join('test.apk')
+    path.write_binary(build_apk({'assets/inner.apk': build_apk()}))
+    apk = APK(str(path))
+    types = dict(apk.get_files_types())
+
+    reloaded = APK(str(path))
+    reloaded.get_raw()
+    assert reloaded.get_files_types() == types
+    assert reloaded.get_files_crc32(verify=True) == apk.get_files_crc32()
+
+
+def test_permissions_follow_analysis_and_setters():
+    apk = APK(build_apk(), raw=True, skip_analysis=True)
+    assert apk.permissions == []
+    apk._apk_analysis()
+    assert apk.permissions
+
+    apk.permissions = ['foo']
+    restored = pickle.loads(pickle.dumps(apk))
+    assert restored.permissions == ['foo']
+    assert restored.uses_permissions == apk.uses_permissions
+
+
+def test_v2_v3_signing_block(tmpdir):
+    cert, cert2, public_key = (read_test_file(name) for name in ('cert.der', 'cert2.der', 'pub.der'))
+    stripping_protection = struct.pack('<III', 8, 0xbeeff00d, 3)
+    data = build_signed_apk(
+        [build_signer([cert, cert2], public_key, attributes=stripping_protection)],
+        [build_signer([cert], public_key, sdks=(24, 0x7fffffff)), build_signer([cert2], public_key, sdks=(28, 33))],
+    )
+    path = tmpdir.join('signed.apk')
+    path.write_binary(data)
+
+    for apk in (APK(data, raw=True), APK(str(path))):
+        assert apk.is_signed_v2() and apk.is_signed_v3()
+        assert apk.get_certificates_der_v2() == [cert, cert2]
+        assert apk.get_certificates_der_v3() == [cert, cert2]
+        assert apk.get_public_keys_der_v2() == [public_key]
+        assert apk.get_public_keys_der_v3() == [public_key, public_key]
+        assert [c.dump() for c in apk.get_certificates_v3()] == [cert, cert2]
+        # the same certificate is only parsed once for both blocks
+        assert apk.get_certificates_v3()[0] is apk.get_certificates_v2()[0]
+
+        v3_signers = apk._v3_signing_data
+        assert [(s.minSDK, s.maxSDK) for s in v3_signers] == [(24, 0x7fffffff), (28, 33)]
+        assert [(s.signed_data.minSDK, s.signed_data.maxSDK) for s in v3_signers] == [(24, 0x7fffffff), (28, 33)]
+
+        v2_signed_data = str(apk._v2_signing_data[0].signed_data)
+        assert 'stripping protection set, scheme 3' in v2_signed_data
+        assert v2_signed_data.count('Subject: CN=') == 2
+        v3_signed_data = str(v3_signers[0].signed_data)
+        assert 'signer minSDK : 24\nsigner maxSDK : 0x7fffffff' in v3_signed_data
+        assert 'Subject: CN=Test, O=Acme, C=US' in v3_signed_data
+        assert 'signer maxSDK : 33' in str(v3_signers[1])